@@ -1,25 +1,198 @@
 import google.generativeai as genai
+import hashlib
 import json
 import os
 import re
+import statistics
+import string
+import tempfile
+import time
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Tuple
 from sklearn.cluster import DBSCAN
 import logging
 
+try:
+    from google import genai as genai_batch  # google-genai SDK, needed for the Batch API
+    from google.genai import types as genai_batch_types
+except ImportError:
+    genai_batch = None
+    genai_batch_types = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - fall back to the stdlib parser
+    orjson = None
+
+try:
+    import numba
+except ImportError:  # Numba is optional - the NumPy filter below is used instead
+    numba = None
+
+try:
+    import diskcache
+except ImportError:  # Cache is optional - fall back to in-process memory
+    diskcache = None
+
 logger = logging.getLogger(__name__)
 
+EARTH_RADIUS_KM = 6371.0088
+SMALL_AREA_THRESHOLD = 32  # Below this many nearby reports, skip pandas/DBSCAN
+MAX_TREND_GAP_WEEKS = 12  # Weeks without reports that split the history into separate runs
+# Named time ranges sent by the frontend ('day' | 'week' | 'month') as pandas offsets
+TIME_RANGE_OFFSETS = {'day': '1D', 'week': '7D', 'month': '30D'}
+AGGREGATES_TTL = 24 * 60 * 60  # Seconds precomputed area aggregates stay valid
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+GEMINI_CACHE_TTL = 24 * 60 * 60  # Seconds a cached Gemini response stays valid
+GEMINI_MEMORY_CACHE_SIZE = 1000  # Entries kept by the in-memory cache when diskcache is missing
+
+SEVERITY_KEYWORDS = {
+    'high': ['high', 'severe', 'critical', 'dangerous'],
+    'medium': ['medium', 'moderate', 'intermediate'],
+    'low': ['low', 'minor', 'minimal']
+}
+RECOMMENDATION_KEYWORDS = ('recommend', 'suggest', 'should', 'need to')
+
+# Patterns used when parsing Gemini responses, compiled once at import
+_SEVERITY_PATTERNS = {
+    level: re.compile(r'\b(' + '|'.join(keywords) + r')\b')
+    for level, keywords in SEVERITY_KEYWORDS.items()
+}
+_CONFIDENCE_RE = re.compile(r'confidence[\s:]+([0-9.]+)')
+_TREND_RE = re.compile('trend', re.IGNORECASE)
+_RECOMMENDATION_RE = re.compile('|'.join(map(re.escape, RECOMMENDATION_KEYWORDS)), re.IGNORECASE)
+
+# Prompt templates, parsed once at import and filled with string.Template.substitute
+PROMPT_TEMPLATE_SEVERITY = string.Template("""Analyze road hazard conditions for location ($lat, $lng).
+
+Historical data summary:
+- Total reports: $total_reports
+- Recent reports ($time_range): $recent_reports
+- High severity reports: $high_severity
+- Verified reports: $verified_reports
+- Resolved issues: $resolved_reports
+
+Based on this data, predict:
+1. Expected hazard severity (high/medium/low)
+2. Confidence level (0-1)
+3. Reporting trends and patterns
+4. Recommendations for monitoring/intervention""")
+
+PROMPT_TEMPLATE_TRENDS = string.Template("""
+Analyze pothole reporting trends for $area_name and provide forecasts:
+
+Historical Data:
+- Total reports: $total_reports
+- Monthly distribution: $monthly_data
+- Severity distribution: $severity_distribution
+
+Provide trend analysis in JSON format:
+{
+    "forecast_period": "Next 6 months",
+    "predicted_reports": {
+        "month1": 15,
+        "month2": 18,
+        "month3": 22
+    },
+    "trend_direction": "increasing|decreasing|stable",
+    "peak_periods": ["monsoon", "post-winter"],
+    "issue_type_trends": {
+        "potholes": "increasing",
+        "drainage": "stable",
+        "street_lamps": "decreasing"
+    },
+    "recommendations": [
+        "Increase maintenance before monsoon",
+        "Focus on high-traffic areas"
+    ],
+    "confidence_level": 0.8
+}
+""")
+
+def _loads_json(json_str: str) -> Any:
+    """Parse JSON text, using orjson when available (its errors subclass json.JSONDecodeError)"""
+    if orjson is not None:
+        return orjson.loads(json_str.encode('utf-8'))
+    return json.loads(json_str)
+
+def _extract_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} object in text, ignoring braces inside strings"""
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    
+    return None
+
+def _time_range_delta(time_range: str) -> pd.Timedelta:
+    """Timedelta for a named time range, or any string pd.Timedelta accepts (e.g. '14D')"""
+    return pd.Timedelta(TIME_RANGE_OFFSETS.get(time_range, time_range))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def _parse_report_date(value) -> datetime:
+    """Parse a report's createdAt (ISO string or datetime) as an aware UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def _within_radius_numpy(lats: np.ndarray, lngs: np.ndarray, target_lat: float, target_lng: float,
+                         r2_deg: float) -> np.ndarray:
+    """Boolean mask of points whose squared degree distance to the target is within r2_deg"""
+    return (lats - target_lat)**2 + (lngs - target_lng)**2 <= r2_deg
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _within_radius(lats, lngs, target_lat, target_lng, r2_deg):
+        out = np.empty(lats.size, dtype=np.bool_)
+        for i in numba.prange(lats.size):
+            d = (lats[i] - target_lat)**2 + (lngs[i] - target_lng)**2
+            out[i] = d <= r2_deg
+        return out
+else:
+    _within_radius = _within_radius_numpy
+
 class PredictiveAnalytics:
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY', '')
         self.model = None
         
+        # Cache of Gemini responses keyed by prompt hash
+        cache_dir = os.getenv('GEMINI_CACHE_DIR', '/tmp/gemini_cache')
+        self._response_cache = diskcache.Cache(cache_dir) if diskcache else OrderedDict()
+        
+        # Per-area analysis precomputed by warm_aggregates(), keyed by location key
+        self._aggregates = {}
+        
         if self.api_key:
             try:
                 genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
+                self.model = genai.GenerativeModel(GEMINI_MODEL_NAME)
                 logger.info("Predictive Analytics initialized with Gemini AI")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini AI: {e}")
@@ -29,27 +202,159 @@ class PredictiveAnalytics:
     def is_enabled(self):
         return self.model is not None
     
-    def predict_pothole_conditions(self, location_data: Dict, historical_reports: List[Dict], time_range: str = 'week') -> Dict[str, Any]:
-        """Predict pothole conditions for a specific area using Gemini AI and statistical analysis"""
+    def _cache_key(self, prompt: str) -> str:
+        """Stable key for a prompt - prompts embed the exact stats, so equal keys mean equal requests"""
+        return hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _get_cached_response(self, key: str) -> Optional[Dict[str, str]]:
+        """Look up a cached Gemini response ({'text', 'generated_at'}), ignoring expired in-memory entries"""
+        entry = self._response_cache.get(key)
+        if entry is not None and not diskcache:
+            if entry[0] <= datetime.now().timestamp():
+                del self._response_cache[key]
+                return None
+            entry = entry[1]
+        return entry
+    
+    def _store_response(self, key: str, response_text: str, generated_at: Optional[str] = None):
+        """Store a Gemini response and when it was generated for GEMINI_CACHE_TTL seconds"""
+        entry = {
+            'text': response_text,
+            'generated_at': generated_at or datetime.now().isoformat()
+        }
+        if diskcache:
+            self._response_cache.set(key, entry, expire=GEMINI_CACHE_TTL)
+        else:
+            self._response_cache[key] = (datetime.now().timestamp() + GEMINI_CACHE_TTL, entry)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > GEMINI_MEMORY_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+    
+    def _cached_generate(self, prompt: str) -> Tuple[str, str]:
+        """Return Gemini's response text and its generation time, reusing a cached response when available"""
+        key = self._cache_key(prompt)
+        
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            logger.debug(f"Gemini cache hit for {key}")
+            return cached['text'], cached['generated_at']
+        
+        response_text = self.model.generate_content(prompt).text
+        generated_at = datetime.now().isoformat()
+        
+        if response_text:
+            self._store_response(key, response_text, generated_at)
+        
+        return response_text, generated_at
+    
+    def schedule_batch_forecasts(self, area_prompts: List[Tuple[str, str]]) -> Optional[str]:
+        """Submit (area_name, prompt) pairs to the Gemini Batch API for offline processing.
+        
+        Use build_trend_prompt() to produce prompts so results land under the same
+        cache keys that generate_trend_forecast() looks up. Returns the batch job name.
+        """
+        if not self.api_key or genai_batch is None:
+            logger.warning("Gemini Batch API not available - skipping batch forecasts")
+            return None
+        
+        if not area_prompts:
+            return None
+        
+        try:
+            client = genai_batch.Client(api_key=self.api_key)
+            
+            # One JSONL line per prompt, keyed by the same hash used for the sync cache
+            with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+                for _, prompt in area_prompts:
+                    f.write(json.dumps({
+                        'key': self._cache_key(prompt),
+                        'request': {'contents': [{'parts': [{'text': prompt}], 'role': 'user'}]}
+                    }) + '\n')
+                jsonl_path = f.name
+            
+            try:
+                uploaded = client.files.upload(
+                    file=jsonl_path,
+                    config=genai_batch_types.UploadFileConfig(display_name='area-forecasts', mime_type='jsonl')
+                )
+            finally:
+                os.remove(jsonl_path)
+            
+            job = client.batches.create(
+                model=GEMINI_MODEL_NAME,
+                src=uploaded.name,
+                config={'display_name': f"area-forecasts-{datetime.now().strftime('%Y%m%d%H%M%S')}"}
+            )
+            
+            logger.info(f"Scheduled Gemini batch job {job.name} for {len(area_prompts)} areas")
+            return job.name
+        except Exception as e:
+            logger.error(f"Failed to schedule Gemini batch forecasts: {e}")
+            return None
+    
+    def collect_batch_forecasts(self, job_name: str) -> Dict[str, Any]:
+        """Poll a Gemini batch job and load finished responses into the response cache"""
+        if not self.api_key or genai_batch is None:
+            return {'state': 'UNAVAILABLE', 'cached': 0}
+        
+        try:
+            client = genai_batch.Client(api_key=self.api_key)
+            job = client.batches.get(name=job_name)
+            state = job.state.name
+            
+            if state != 'JOB_STATE_SUCCEEDED':
+                return {'state': state, 'cached': 0}
+            
+            content = client.files.download(file=job.dest.file_name).decode('utf-8')
+            
+            # Batch results are stamped with when the job finished, not when they were collected
+            end_time = getattr(job, 'end_time', None)
+            generated_at = end_time.astimezone().replace(tzinfo=None).isoformat() if end_time else None
+            
+            cached = 0
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                if 'response' not in result:
+                    logger.warning(f"Batch request {result.get('key')} failed: {result.get('error')}")
+                    continue
+                
+                parts = result['response']['candidates'][0]['content']['parts']
+                response_text = ''.join(part.get('text', '') for part in parts)
+                if response_text:
+                    self._store_response(result['key'], response_text, generated_at)
+                    cached += 1
+            
+            logger.info(f"Cached {cached} responses from Gemini batch job {job_name}")
+            return {'state': state, 'cached': cached}
+        except Exception as e:
+            logger.error(f"Failed to collect Gemini batch job {job_name}: {e}")
+            return {'state': 'ERROR', 'cached': 0}
+    
+    def predict_pothole_conditions(self, location_data: Dict, historical_reports: List[Dict], time_range: str = 'week',
+                                   use_aggregates: bool = False) -> Dict[str, Any]:
+        """Predict pothole conditions for a specific area using Gemini AI and statistical analysis.
+        
+        With use_aggregates=True, an area warmed by warm_aggregates() is served from its
+        precomputed analysis and historical_reports is ignored (results may be up to
+        AGGREGATES_TTL old). Areas without a fresh aggregate are analyzed from historical_reports.
+        """
         if not self.is_enabled():
-            return self._fallback_prediction(location_data, historical_reports, time_range)
+            return self._fallback_prediction(location_data, historical_reports, time_range, use_aggregates)
 
         try:
-            # Process historical data
-            df = self._process_historical_data(historical_reports, location_data)
-            
-            # Identify hotspots
-            hotspots = self._identify_hotspots(df)
+            # Hotspots, statistical trends and prompt stats for the area
+            analysis = self._analyze_area(historical_reports, location_data, time_range, use_aggregates)
+            hotspots = analysis['hotspots']
+            statistical_trends = analysis['trends']
             
             # Generate AI prompt with historical data
-            prompt = self._generate_ai_prompt(df, location_data, time_range)
+            prompt = self._generate_ai_prompt(analysis['stats'], location_data, time_range)
             
             # Get AI prediction
-            response = self.model.generate_content(prompt)
-            ai_insights = self._parse_ai_response(response.text)
-            
-            # Combine AI insights with statistical analysis
-            statistical_trends = self._analyze_trends(df)
+            response_text, _ = self._cached_generate(prompt)
+            ai_insights = self._parse_ai_response(response_text)
             
             result = {
                 'predictedSeverity': ai_insights.get('severity', statistical_trends['prediction']),
@@ -64,14 +369,15 @@ class PredictiveAnalytics:
             return result
         except Exception as e:
             logger.error(f"Error in AI prediction: {e}")
-            return self._fallback_prediction(location_data, historical_reports, time_range)
+            return self._fallback_prediction(location_data, historical_reports, time_range, use_aggregates)
 
-    def _fallback_prediction(self, location_data: Dict, historical_reports: List[Dict], time_range: str) -> Dict[str, Any]:
+    def _fallback_prediction(self, location_data: Dict, historical_reports: List[Dict], time_range: str,
+                             use_aggregates: bool = False) -> Dict[str, Any]:
         """Statistical fallback when AI prediction fails"""
         try:
-            df = self._process_historical_data(historical_reports, location_data)
-            hotspots = self._identify_hotspots(df)
-            trends = self._analyze_trends(df)
+            analysis = self._analyze_area(historical_reports, location_data, time_range, use_aggregates)
+            hotspots = analysis['hotspots']
+            trends = analysis['trends']
             
             return {
                 'predictedSeverity': trends['prediction'],
@@ -96,63 +402,134 @@ class PredictiveAnalytics:
                 }
             }
 
-    def _process_historical_data(self, reports: List[Dict], location: Dict[str, float], 
-                               radius_km: float = 5) -> pd.DataFrame:
-        """Process historical reports into a DataFrame for analysis"""
-        relevant_reports = []
+    def _get_location_key(self, lat, lng):
+        """Generate a location key for precomputed aggregates (rounded to ~100m precision)"""
+        return f"{round(lat, 3)}_{round(lng, 3)}"
+    
+    def warm_aggregates(self, reports: List[Dict], locations: List[Dict[str, float]], time_range: str = 'week') -> int:
+        """Precompute area analysis for known locations so predictions skip scanning history.
         
-        for report in reports:
-            report_lat = report['location']['lat']
-            report_lng = report['location']['lng']
-            
-            # Calculate distance from target location
-            distance = np.sqrt(
-                (report_lat - location['lat'])**2 + 
-                (report_lng - location['lng'])**2
-            ) * 111  # Rough conversion to km
-            
-            if distance <= radius_km:
-                report_data = {
-                    'latitude': report_lat,
-                    'longitude': report_lng,
-                    'severity': report['severity'],
-                    'created_at': pd.to_datetime(report['createdAt']),
-                    'type': report.get('type', 'pothole'),
-                    'verified': report['verified'],
-                    'fixing_status': report['fixingStatus'],
-                }
-                relevant_reports.append(report_data)
+        Meant to run periodically (e.g. nightly). Aggregates are only read when callers
+        pass use_aggregates=True; entries older than AGGREGATES_TTL, or computed for a
+        different time_range, are ignored and the area is analyzed from the given reports.
+        Returns the number of locations warmed.
+        """
+        aggregates = {}
+        for location in locations:
+            key = self._get_location_key(location['lat'], location['lng'])
+            aggregates[key] = {
+                'analysis': self._analyze_area(reports, location, time_range),
+                'time_range': time_range,
+                'warmed_at': time.monotonic()
+            }
+        
+        self._aggregates = aggregates
+        logger.info(f"Warmed predictive aggregates for {len(aggregates)} locations from {len(reports)} reports")
+        return len(aggregates)
+    
+    def _get_aggregate(self, location: Dict[str, float], time_range: str) -> Optional[Dict[str, Any]]:
+        """Return the precomputed analysis for a location, if still fresh"""
+        entry = self._aggregates.get(self._get_location_key(location['lat'], location['lng']))
+        if entry is None or entry['time_range'] != time_range:
+            return None
+        if time.monotonic() - entry['warmed_at'] > AGGREGATES_TTL:
+            return None
+        return entry['analysis']
+    
+    def _analyze_area(self, reports: List[Dict], location: Dict[str, float], time_range: str,
+                      use_aggregates: bool = False) -> Dict[str, Any]:
+        """Compute prompt stats, hotspots and trends for the reports near a location"""
+        if use_aggregates:
+            aggregate = self._get_aggregate(location, time_range)
+            if aggregate is not None:
+                return aggregate
         
-        return pd.DataFrame(relevant_reports)
+        relevant_reports = self._filter_relevant_reports(reports, location)
+        
+        # Small areas skip the fixed pandas/sklearn overhead entirely
+        if len(relevant_reports) < SMALL_AREA_THRESHOLD:
+            return self._analyze_small_area(relevant_reports, time_range)
+        
+        df = self._reports_to_dataframe(relevant_reports)
+        return {
+            'stats': self._compute_prompt_stats(df, time_range),
+            'hotspots': self._identify_hotspots(df),
+            'trends': self._analyze_trends(df)
+        }
+    
+    def _filter_relevant_reports(self, reports: List[Dict], location: Dict[str, float],
+                                 radius_km: float = 5) -> List[Dict]:
+        """Return the reports within radius_km of the location"""
+        if not reports:
+            return []
+        
+        # Filter on plain float arrays first so only nearby reports get flattened
+        lat = np.fromiter((r['location']['lat'] for r in reports), dtype=np.float64, count=len(reports))
+        lng = np.fromiter((r['location']['lng'] for r in reports), dtype=np.float64, count=len(reports))
+        
+        # Compare squared distances in degrees (~111 km per degree) to skip the sqrt
+        radius_deg = radius_km / 111
+        mask = _within_radius(lat, lng, float(location['lat']), float(location['lng']), radius_deg**2)
+        
+        return [reports[i] for i in np.flatnonzero(mask)]
+    
+    def _reports_to_dataframe(self, reports: List[Dict]) -> pd.DataFrame:
+        """Build the analysis DataFrame from already-filtered reports"""
+        if not reports:
+            return pd.DataFrame()
+        
+        # Flatten nested location into location_lat / location_lng columns
+        raw = pd.json_normalize(reports, sep='_')
+        
+        return pd.DataFrame({
+            'latitude': raw['location_lat'],
+            'longitude': raw['location_lng'],
+            'severity': raw['severity'],
+            'created_at': pd.to_datetime(raw['createdAt'], utc=True, cache=True, format='ISO8601'),
+            'type': raw['type'].fillna('pothole') if 'type' in raw else 'pothole',
+            'verified': raw['verified'],
+            'fixing_status': raw['fixingStatus'],
+        }).reset_index(drop=True)
 
     def _identify_hotspots(self, df: pd.DataFrame, eps_km: float = 0.1) -> List[Dict]:
         """Identify clusters of reports using DBSCAN"""
         if df.empty:
             return []
             
-        # Convert eps from km to degrees (rough approximation)
-        eps_degrees = eps_km / 111
+        coords = df[['latitude', 'longitude']].to_numpy(dtype=np.float64)
         
-        coords = df[['latitude', 'longitude']].values
-        clustering = DBSCAN(eps=eps_degrees, min_samples=3).fit(coords)
+        # Haversine distances on a BallTree: eps is expressed in radians of arc
+        coords_rad = np.radians(coords)
+        clustering = DBSCAN(
+            eps=eps_km / EARTH_RADIUS_KM,
+            min_samples=3,
+            metric='haversine',
+            algorithm='ball_tree',
+            n_jobs=-1
+        ).fit(coords_rad)
         
-        hotspots = []
-        for cluster_id in set(clustering.labels_):
-            if cluster_id == -1:  # Skip noise points
-                continue
-                
-            cluster_points = coords[clustering.labels_ == cluster_id]
-            cluster_center = cluster_points.mean(axis=0)
-            cluster_size = len(cluster_points)
-            
-            hotspots.append({
-                'lat': float(cluster_center[0]),
-                'lng': float(cluster_center[1]),
-                'intensity': min(1.0, cluster_size / 10),  # Normalize intensity
-                'count': int(cluster_size)
-            })
-        
-        return hotspots
+        labels = clustering.labels_
+        keep = labels >= 0  # Skip noise points
+        if not keep.any():
+            return []
+        
+        # Aggregate every cluster in one O(N) pass; labels are 0..K-1
+        lab = labels[keep]
+        pts = coords[keep]
+        counts = np.bincount(lab)
+        sum_lat = np.bincount(lab, weights=pts[:, 0])
+        sum_lng = np.bincount(lab, weights=pts[:, 1])
+        centers = np.stack([sum_lat / counts, sum_lng / counts], axis=1)
+        
+        return [
+            {
+                'lat': float(center[0]),
+                'lng': float(center[1]),
+                'intensity': min(1.0, int(count) / 10),  # Normalize intensity
+                'count': int(count)
+            }
+            for center, count in zip(centers, counts)
+        ]
 
     def _analyze_trends(self, df: pd.DataFrame) -> Dict:
         """Analyze reporting trends over time"""
@@ -163,24 +540,39 @@ class PredictiveAnalytics:
                 'prediction': 'low'
             }
             
-        # Calculate weekly frequencies
-        weekly_counts = df.resample('W', on='created_at').size()
+        # Calculate weekly frequencies: bucket days since epoch into 7-day bins
+        days = df['created_at'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        week_idx = np.sort(days // 7)
         
-        if len(weekly_counts) < 2:
+        # Keep only the most recent contiguous run of weeks so a stale outlier
+        # timestamp doesn't create a long stretch of empty bins
+        gaps = np.flatnonzero(np.diff(week_idx) > MAX_TREND_GAP_WEEKS)
+        if gaps.size:
+            week_idx = week_idx[gaps[-1] + 1:]
+        
+        weekly_counts = np.bincount(week_idx - week_idx[0]).astype(np.float64)
+        
+        if weekly_counts.size < 2:
             return {
                 'trend': 'stable',
-                'frequency': float(weekly_counts.mean() if not weekly_counts.empty else 0),
+                'frequency': float(weekly_counts.mean()),
                 'prediction': 'low'
             }
             
-        # Calculate trend
-        slope = np.polyfit(range(len(weekly_counts)), weekly_counts.values, 1)[0]
-        
-        trend = 'increasing' if slope > 0.1 else 'decreasing' if slope < -0.1 else 'stable'
+        # Calculate trend as the closed-form least-squares slope
+        x = np.arange(weekly_counts.size, dtype=np.float64)
+        x_centered = x - x.mean()
+        slope = (x_centered * (weekly_counts - weekly_counts.mean())).sum() / (x_centered**2).sum()
         
         # Predict severity based on recent frequency and trend
         recent_frequency = float(weekly_counts[-4:].mean())  # Last 4 weeks
         
+        return self._classify_trend(float(slope), recent_frequency)
+    
+    def _classify_trend(self, slope: float, recent_frequency: float) -> Dict:
+        """Turn a weekly slope and recent weekly frequency into a trend prediction"""
+        trend = 'increasing' if slope > 0.1 else 'decreasing' if slope < -0.1 else 'stable'
+        
         prediction = 'high' if recent_frequency > 5 or (trend == 'increasing' and recent_frequency > 3) else \
                     'medium' if recent_frequency > 2 or trend == 'increasing' else \
                     'low'
@@ -191,55 +583,98 @@ class PredictiveAnalytics:
             'prediction': prediction
         }
 
-    def _generate_ai_prompt(self, df: pd.DataFrame, location: Dict[str, float], time_range: str) -> str:
-        """Generate prompt for Gemini AI"""
-        recent_reports = df[df['created_at'] >= pd.Timestamp.now() - pd.Timedelta(time_range)]
+    def _analyze_small_area(self, reports: List[Dict], time_range: str) -> Dict[str, Any]:
+        """Pure-Python stats and trends for areas with fewer than SMALL_AREA_THRESHOLD reports.
+        
+        Hotspot clustering is skipped: a handful of reports can't form meaningful clusters.
+        """
+        empty_trends = {
+            'trend': 'stable',
+            'frequency': 0,
+            'prediction': 'low'
+        }
+        
+        dates = [_parse_report_date(report['createdAt']) for report in reports]
+        cutoff = datetime.now(timezone.utc) - _time_range_delta(time_range).to_pytimedelta()
         
+        severity_counts = Counter(report['severity'] for report in reports)
         stats = {
-            'total_reports': len(df),
-            'recent_reports': len(recent_reports),
-            'high_severity': len(df[df['severity'] == 'high']),
-            'verified_reports': len(df[df['verified'] == 'verified']),
-            'resolved_reports': len(df[df['fixing_status'] == 'resolved'])
+            'total_reports': len(reports),
+            'recent_reports': sum(1 for date in dates if date >= cutoff),
+            'high_severity': severity_counts['high'],
+            'verified_reports': sum(1 for report in reports if report['verified'] == 'verified'),
+            'resolved_reports': sum(1 for report in reports if report['fixingStatus'] == 'resolved')
         }
         
-        prompt = f"""Analyze road hazard conditions for location ({location['lat']}, {location['lng']}).
-
-Historical data summary:
-- Total reports: {stats['total_reports']}
-- Recent reports ({time_range}): {stats['recent_reports']}
-- High severity reports: {stats['high_severity']}
-- Verified reports: {stats['verified_reports']}
-- Resolved issues: {stats['resolved_reports']}
-
-Based on this data, predict:
-1. Expected hazard severity (high/medium/low)
-2. Confidence level (0-1)
-3. Reporting trends and patterns
-4. Recommendations for monitoring/intervention"""
+        if not reports:
+            return {'stats': stats, 'hotspots': [], 'trends': empty_trends}
+        
+        # Same week bucketing and gap trimming as _analyze_trends
+        week_idx = sorted((date - _EPOCH).days // 7 for date in dates)
+        for i in range(len(week_idx) - 1, 0, -1):
+            if week_idx[i] - week_idx[i - 1] > MAX_TREND_GAP_WEEKS:
+                week_idx = week_idx[i:]
+                break
+        
+        week_counts = Counter(week_idx)
+        weekly_counts = [week_counts.get(week, 0) for week in range(week_idx[0], week_idx[-1] + 1)]
         
-        return prompt
+        if len(weekly_counts) < 2:
+            trends = dict(empty_trends, frequency=float(statistics.mean(weekly_counts)))
+        else:
+            x_mean = (len(weekly_counts) - 1) / 2
+            y_mean = statistics.mean(weekly_counts)
+            slope = sum((x - x_mean) * (y - y_mean) for x, y in enumerate(weekly_counts)) / \
+                    sum((x - x_mean)**2 for x in range(len(weekly_counts)))
+            trends = self._classify_trend(slope, float(statistics.mean(weekly_counts[-4:])))
+        
+        return {'stats': stats, 'hotspots': [], 'trends': trends}
+    
+    def _compute_prompt_stats(self, df: pd.DataFrame, time_range: str) -> Dict[str, int]:
+        """Aggregate counts that go into the Gemini prompt"""
+        # One value_counts pass per column instead of a filtered copy per statistic
+        severity_counts = df['severity'].value_counts()
+        verified_counts = df['verified'].value_counts()
+        fixing_counts = df['fixing_status'].value_counts()
+        
+        cutoff = (pd.Timestamp.now(tz='UTC') - _time_range_delta(time_range)).tz_convert(None).to_datetime64()
+        created_at = df['created_at'].to_numpy(dtype='datetime64[ns]')
+        
+        stats = {
+            'total_reports': len(df),
+            'recent_reports': int((created_at >= cutoff).sum()),
+            'high_severity': int(severity_counts.get('high', 0)),
+            'verified_reports': int(verified_counts.get('verified', 0)),
+            'resolved_reports': int(fixing_counts.get('resolved', 0))
+        }
+        
+        return stats
+    
+    def _generate_ai_prompt(self, stats: Dict[str, int], location: Dict[str, float], time_range: str) -> str:
+        """Generate prompt for Gemini AI"""
+        return PROMPT_TEMPLATE_SEVERITY.substitute(
+            lat=location['lat'],
+            lng=location['lng'],
+            time_range=time_range,
+            **stats
+        )
 
     def _parse_ai_response(self, response_text: str) -> Dict[str, Any]:
         """Parse Gemini AI response into structured data"""
         try:
-            # Extract severity
-            severity_keywords = {
-                'high': ['high', 'severe', 'critical', 'dangerous'],
-                'medium': ['medium', 'moderate', 'intermediate'],
-                'low': ['low', 'minor', 'minimal']
-            }
+            lower = response_text.lower()
+            lines = response_text.splitlines()
             
+            # Extract severity
             severity = 'medium'  # Default
-            for level, keywords in severity_keywords.items():
-                if any(keyword in response_text.lower() for keyword in keywords):
+            for level, pattern in _SEVERITY_PATTERNS.items():
+                if pattern.search(lower):
                     severity = level
                     break
             
             # Extract confidence (look for numbers between 0 and 1)
-            import re
-            confidence_matches = re.findall(r'confidence[\s:]+([0-9.]+)', response_text.lower())
-            confidence = float(confidence_matches[0]) if confidence_matches else 0.7
+            confidence_match = _CONFIDENCE_RE.search(lower)
+            confidence = float(confidence_match.group(1)) if confidence_match else 0.7
             
             # Extract trends
             trends = {
@@ -248,14 +683,16 @@ Based on this data, predict:
             }
             
             # Look for trend indicators
-            if 'trend' in response_text.lower():
-                trend_section = response_text.split('trend')[1].split('\n')[0]
+            # Match on the original text: lower() can change length, shifting offsets
+            trend_match = _TREND_RE.search(response_text)
+            if trend_match:
+                trend_section = response_text[trend_match.end():].split('\n', 1)[0]
                 trends['description'] = trend_section.strip()
             
             # Look for recommendations
             recommendations = []
-            for line in response_text.split('\n'):
-                if any(word in line.lower() for word in ['recommend', 'suggest', 'should', 'need to']):
+            for line in lines:
+                if _RECOMMENDATION_RE.search(line):
                     recommendations.append(line.strip())
             
             trends['recommendations'] = recommendations
@@ -276,81 +713,19 @@ Based on this data, predict:
                     'recommendations': []
                 }
             }
-            return self._generate_mock_prediction(location_data)
+    
+    def build_trend_prompt(self, historical_reports: List[Dict], area_name: str = "Selected Area") -> str:
+        """Build the trend forecast prompt for an area (shared by sync and batch paths)"""
+        # Analyze historical patterns
+        monthly_data = self._analyze_monthly_patterns(historical_reports)
+        severity_distribution = self._analyze_severity_distribution(historical_reports)
         
-        try:
-            # Prepare historical data summary
-            report_summary = self._summarize_historical_reports(historical_reports)
-            
-            # Create prediction prompt
-            prompt = f"""
-            Analyze the following data to predict pothole conditions and trends:
-            
-            Location: {location_data.get('address', 'Unknown location')}
-            Coordinates: {location_data.get('lat', 'N/A')}, {location_data.get('lng', 'N/A')}
-            
-            Historical Report Data:
-            - Total reports in area: {len(historical_reports)}
-            - Report summary: {report_summary}
-            
-            Please provide predictions in the following JSON format:
-            {{
-                "predicted_severity": "high|medium|low",
-                "confidence": 0.75,
-                "risk_factors": ["factor1", "factor2", "factor3"],
-                "timeframe": "Next 30 days",
-                "trend_analysis": {{
-                    "increasing": true,
-                    "peak_months": ["month1", "month2"],
-                    "seasonal_pattern": "description"
-                }},
-                "recommendations": ["recommendation1", "recommendation2"],
-                "weather_impact": "description of how weather affects potholes in this area"
-            }}
-            
-            Base your predictions on:
-            1. Historical report frequency and severity
-            2. Seasonal patterns (monsoon, winter effects)
-            3. Traffic density implications
-            4. Road infrastructure age
-            5. Weather patterns typical for the region
-            """
-            
-            response = self.model.generate_content(prompt)
-            
-            if response.text:
-                try:
-                    # Extract JSON from response
-                    json_start = response.text.find('{')
-                    json_end = response.text.rfind('}') + 1
-                    
-                    if json_start != -1 and json_end != -1:
-                        json_str = response.text[json_start:json_end]
-                        prediction_data = json.loads(json_str)
-                        
-                        # Add metadata
-                        prediction_data.update({
-                            'generated_at': datetime.now().isoformat(),
-                            'location': location_data,
-                            'data_points': len(historical_reports),
-                            'model': 'gemini-1.5-flash'
-                        })
-                        
-                        return prediction_data
-                    else:
-                        logger.warning("No valid JSON found in Gemini response")
-                        return self._generate_mock_prediction(location_data)
-                        
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse Gemini JSON response: {e}")
-                    return self._generate_mock_prediction(location_data)
-            else:
-                logger.warning("Empty response from Gemini AI")
-                return self._generate_mock_prediction(location_data)
-                
-        except Exception as e:
-            logger.error(f"Error generating predictions: {e}")
-            return self._generate_mock_prediction(location_data)
+        return PROMPT_TEMPLATE_TRENDS.substitute(
+            area_name=area_name,
+            total_reports=len(historical_reports),
+            monthly_data=monthly_data,
+            severity_distribution=severity_distribution
+        )
     
     def generate_trend_forecast(self, historical_reports: List[Dict], area_name: str = "Selected Area") -> Dict[str, Any]:
         """Generate reporting trend forecasts using Gemini AI"""
@@ -358,57 +733,22 @@ Based on this data, predict:
             return self._generate_mock_trends(historical_reports, area_name)
         
         try:
-            # Analyze historical patterns
-            monthly_data = self._analyze_monthly_patterns(historical_reports)
-            severity_distribution = self._analyze_severity_distribution(historical_reports)
-            
-            prompt = f"""
-            Analyze pothole reporting trends for {area_name} and provide forecasts:
-            
-            Historical Data:
-            - Total reports: {len(historical_reports)}
-            - Monthly distribution: {monthly_data}
-            - Severity distribution: {severity_distribution}
-            
-            Provide trend analysis in JSON format:
-            {{
-                "forecast_period": "Next 6 months",
-                "predicted_reports": {{
-                    "month1": 15,
-                    "month2": 18,
-                    "month3": 22
-                }},
-                "trend_direction": "increasing|decreasing|stable",
-                "peak_periods": ["monsoon", "post-winter"],
-                "issue_type_trends": {{
-                    "potholes": "increasing",
-                    "drainage": "stable",
-                    "street_lamps": "decreasing"
-                }},
-                "recommendations": [
-                    "Increase maintenance before monsoon",
-                    "Focus on high-traffic areas"
-                ],
-                "confidence_level": 0.8
-            }}
-            """
+            prompt = self.build_trend_prompt(historical_reports, area_name)
             
-            response = self.model.generate_content(prompt)
+            response_text, generated_at = self._cached_generate(prompt)
             
-            if response.text:
+            if response_text:
                 try:
-                    json_start = response.text.find('{')
-                    json_end = response.text.rfind('}') + 1
+                    json_str = _extract_json_object(response_text)
                     
-                    if json_start != -1 and json_end != -1:
-                        json_str = response.text[json_start:json_end]
-                        trend_data = json.loads(json_str)
+                    if json_str is not None:
+                        trend_data = _loads_json(json_str)
                         
                         trend_data.update({
-                            'generated_at': datetime.now().isoformat(),
+                            'generated_at': generated_at,
                             'area_name': area_name,
                             'data_points': len(historical_reports),
-                            'model': 'gemini-1.5-flash'
+                            'model': GEMINI_MODEL_NAME
                         })
                         
                         return trend_data
@@ -424,38 +764,20 @@ Based on this data, predict:
             logger.error(f"Error generating trend forecast: {e}")
             return self._generate_mock_trends(historical_reports, area_name)
     
-    def _summarize_historical_reports(self, reports: List[Dict]) -> str:
-        """Summarize historical reports for AI analysis"""
-        if not reports:
-            return "No historical data available"
-        
-        # Count by severity
-        severity_counts = {'high': 0, 'medium': 0, 'low': 0}
-        for report in reports:
-            severity = report.get('severity', 'medium')
-            severity_counts[severity] = severity_counts.get(severity, 0) + 1
-        
-        # Recent activity
-        recent_reports = [r for r in reports if self._is_recent(r.get('createdAt'))]
-        
-        return f"High: {severity_counts['high']}, Medium: {severity_counts['medium']}, Low: {severity_counts['low']}. Recent activity: {len(recent_reports)} reports in last 30 days."
-    
     def _analyze_monthly_patterns(self, reports: List[Dict]) -> Dict[str, int]:
         """Analyze monthly reporting patterns"""
-        monthly_counts = {}
-        for report in reports:
-            try:
-                if isinstance(report.get('createdAt'), str):
-                    date = datetime.fromisoformat(report['createdAt'].replace('Z', '+00:00'))
-                else:
-                    date = report.get('createdAt', datetime.now())
-                
-                month_key = date.strftime('%Y-%m')
-                monthly_counts[month_key] = monthly_counts.get(month_key, 0) + 1
-            except:
-                continue
+        if not reports:
+            return {}
+        
+        # Unparseable dates become NaT and are dropped by value_counts
+        dates = pd.to_datetime(
+            pd.Series([report.get('createdAt') for report in reports]),
+            utc=True, errors='coerce', format='ISO8601'
+        )
+        # Bucket by UTC calendar month, matching the UTC week bins in _analyze_trends
+        monthly_counts = dates.dt.strftime('%Y-%m').value_counts().sort_index()
         
-        return monthly_counts
+        return {month: int(count) for month, count in monthly_counts.items()}
     
     def _analyze_severity_distribution(self, reports: List[Dict]) -> Dict[str, int]:
         """Analyze severity distribution"""
@@ -466,41 +788,6 @@ Based on this data, predict:
         
         return severity_counts
     
-    def _is_recent(self, date_str) -> bool:
-        """Check if a date is within the last 30 days"""
-        try:
-            if isinstance(date_str, str):
-                date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            else:
-                date = date_str
-            
-            return (datetime.now() - date).days <= 30
-        except:
-            return False
-    
-    def _generate_mock_prediction(self, location_data: Dict) -> Dict[str, Any]:
-        """Generate mock prediction when AI is not available"""
-        return {
-            'predicted_severity': 'medium',
-            'confidence': 0.65,
-            'risk_factors': ['Heavy traffic', 'Monsoon season', 'Road age'],
-            'timeframe': 'Next 30 days',
-            'trend_analysis': {
-                'increasing': True,
-                'peak_months': ['July', 'August'],
-                'seasonal_pattern': 'Higher activity during monsoon season'
-            },
-            'recommendations': [
-                'Increase monitoring during monsoon',
-                'Schedule preventive maintenance'
-            ],
-            'weather_impact': 'Monsoon rains likely to worsen existing potholes',
-            'generated_at': datetime.now().isoformat(),
-            'location': location_data,
-            'data_points': 0,
-            'model': 'mock-fallback'
-        }
-    
     def _generate_mock_trends(self, reports: List[Dict], area_name: str) -> Dict[str, Any]:
         """Generate mock trends when AI is not available"""
         return {
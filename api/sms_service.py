@@ -1,20 +1,50 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import os
-from datetime import datetime, timedelta
-from collections import defaultdict
+import time
+from collections import OrderedDict
 import logging
 
+try:
+    import aiohttp
+except ImportError:  # Async batching is optional - SMSService works without it
+    aiohttp = None
+
 logger = logging.getLogger(__name__)
 
 class SMSService:
+    # Characters stripped from phone numbers in a single str.translate pass
+    _STRIP = str.maketrans('', '', '+ -')
+    _PREFIX = '91'
+    
     def __init__(self):
         # Fast2SMS configuration
         self.api_key = os.getenv('FAST2SMS_API_KEY', '')
         self.base_url = "https://www.fast2sms.com/dev/bulkV2"
         
+        # Shared session so keep-alive reuses the TLS connection across alerts
+        self._session = requests.Session()
+        self._session.headers.update({
+            'Content-Type': 'application/x-www-form-urlencoded'
+        })
+        # Only retry failed connects: once the POST is sent, a timeout or 5xx may
+        # still mean Fast2SMS delivered (and billed) the SMS
+        retries = Retry(
+            total=2,
+            connect=2,
+            read=0,
+            status=0,
+            backoff_factor=0.3
+        )
+        self._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+        
         # Rate limiting to prevent spam
-        self.sent_alerts = defaultdict(list)  # location_key -> [timestamps]
-        self.max_alerts_per_day = 1
+        # One alert per location per day, so a single monotonic timestamp per key suffices
+        self.sent_alerts = OrderedDict()  # location_key -> time.monotonic() of last alert
+        self.alert_window = 24 * 60 * 60
+        self.max_tracked_locations = 100000
         
         if not self.api_key:
             logger.warning("Fast2SMS API key not configured - SMS alerts disabled")
@@ -26,28 +56,34 @@ class SMSService:
         """Generate a location key for rate limiting (rounded to ~100m precision)"""
         return f"{round(lat, 3)}_{round(lng, 3)}"
     
+    def _clean_number(self, number):
+        """Normalize a phone number to 10 digits (Fast2SMS adds the +91 prefix itself)"""
+        clean_number = str(number).translate(self._STRIP)
+        if clean_number.startswith(self._PREFIX) and len(clean_number) == 12:
+            clean_number = clean_number[len(self._PREFIX):]
+        return clean_number
+    
     def _can_send_alert(self, location_key):
         """Check if we can send an alert for this location (rate limiting)"""
-        now = datetime.now()
-        yesterday = now - timedelta(days=1)
-        
-        # Clean old alerts
-        self.sent_alerts[location_key] = [
-            timestamp for timestamp in self.sent_alerts[location_key]
-            if timestamp > yesterday
-        ]
+        last_sent = self.sent_alerts.get(location_key)
+        return last_sent is None or time.monotonic() - last_sent >= self.alert_window
+    
+    def _mark_alert_sent(self, location_key):
+        """Record an alert for rate limiting, evicting the least recently alerted locations"""
+        self.sent_alerts[location_key] = time.monotonic()
+        self.sent_alerts.move_to_end(location_key)
         
-        # Check if we've exceeded the daily limit
-        return len(self.sent_alerts[location_key]) < self.max_alerts_per_day
+        while len(self.sent_alerts) > self.max_tracked_locations:
+            self.sent_alerts.popitem(last=False)
     
-    def send_high_priority_alert(self, phone_numbers, location_data, report_count):
-        """Send SMS alert for high-priority pothole location"""
+    def _prepare_alert(self, phone_numbers, location_data, report_count):
+        """Validate an alert request; returns (error, location_key, message, clean_numbers)"""
         if not self.is_enabled():
             logger.warning("SMS service not enabled - skipping alert")
-            return False, "SMS service not configured"
+            return "SMS service not configured", None, None, None
         
         if not phone_numbers:
-            return False, "No phone numbers provided"
+            return "No phone numbers provided", None, None, None
         
         # Generate location key for rate limiting
         location_key = self._get_location_key(
@@ -58,7 +94,7 @@ class SMSService:
         # Check rate limiting
         if not self._can_send_alert(location_key):
             logger.info(f"Rate limit reached for location {location_key}")
-            return False, "Daily alert limit reached for this location"
+            return "Daily alert limit reached for this location", None, None, None
         
         # Prepare message
         address = location_data.get('address', f"Lat: {location_data.get('lat', 'N/A')}, Lng: {location_data.get('lng', 'N/A')}")
@@ -67,34 +103,41 @@ class SMSService:
         # Prepare phone numbers (remove +91 prefix if present, Fast2SMS adds it automatically)
         clean_numbers = []
         for number in phone_numbers:
-            clean_number = str(number).replace('+91', '').replace(' ', '').replace('-', '')
+            clean_number = self._clean_number(number)
             if len(clean_number) == 10 and clean_number.isdigit():
                 clean_numbers.append(clean_number)
         
         if not clean_numbers:
-            return False, "No valid phone numbers found"
+            return "No valid phone numbers found", None, None, None
+        
+        return None, location_key, message, clean_numbers
+    
+    def _build_payload(self, message, numbers):
+        """Fast2SMS API payload for a message sent to a list of clean numbers"""
+        return {
+            'authorization': self.api_key,
+            'message': message,
+            'numbers': ','.join(numbers),
+            'route': 'q',  # Promotional route (free tier)
+            'sender_id': 'FXPTHL'  # 6-character sender ID
+        }
+    
+    def send_high_priority_alert(self, phone_numbers, location_data, report_count):
+        """Send SMS alert for high-priority pothole location"""
+        error, location_key, message, clean_numbers = self._prepare_alert(phone_numbers, location_data, report_count)
+        if error:
+            return False, error
         
         try:
-            # Fast2SMS API payload
-            payload = {
-                'authorization': self.api_key,
-                'message': message,
-                'numbers': ','.join(clean_numbers),
-                'route': 'q',  # Promotional route (free tier)
-                'sender_id': 'FXPTHL'  # 6-character sender ID
-            }
-            
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
+            payload = self._build_payload(message, clean_numbers)
             
-            response = requests.post(self.base_url, data=payload, headers=headers, timeout=10)
+            response = self._session.post(self.base_url, data=payload, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get('return') == True:
                     # Mark alert as sent
-                    self.sent_alerts[location_key].append(datetime.now())
+                    self._mark_alert_sent(location_key)
                     logger.info(f"SMS alert sent successfully to {len(clean_numbers)} numbers")
                     return True, f"Alert sent to {len(clean_numbers)} recipients"
                 else:
@@ -120,7 +163,7 @@ class SMSService:
         if not self.is_enabled():
             return False, "SMS service not configured"
         
-        clean_number = str(phone_number).replace('+91', '').replace(' ', '').replace('-', '')
+        clean_number = self._clean_number(phone_number)
         if len(clean_number) != 10 or not clean_number.isdigit():
             return False, "Invalid phone number format"
         
@@ -133,11 +176,7 @@ class SMSService:
                 'sender_id': 'FXPTHL'
             }
             
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            
-            response = requests.post(self.base_url, data=payload, headers=headers, timeout=10)
+            response = self._session.post(self.base_url, data=payload, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -149,4 +188,172 @@ class SMSService:
                 return False, f"HTTP error: {response.status_code}"
                 
         except Exception as e:
-            return False, f"Error: {str(e)}"
\ No newline at end of file
+            return False, f"Error: {str(e)}"
+
+
+class AsyncSMSService(SMSService):
+    """SMSService that coalesces alerts and sends them concurrently with aiohttp.
+    
+    Alerts awaited through queue_high_priority_alert() within FLUSH_INTERVAL seconds
+    that share the same message text go out as a single Fast2SMS request with all
+    their numbers joined. The synchronous send_high_priority_alert() keeps the
+    blocking SMSService path, so its result always reflects a real send.
+    
+    The queue, flush task and HTTP session belong to one event loop; they are rebuilt
+    when called from a different loop (e.g. asyncio.run() per request). Alerts that
+    can't be sent because the loop stopped or close() was called fail and release
+    their rate limit slot.
+    """
+    FLUSH_INTERVAL = 0.5
+    
+    def __init__(self):
+        super().__init__()
+        self._loop = None
+        self._pending = None
+        self._flush_task = None
+    
+    async def queue_high_priority_alert(self, phone_numbers, location_data, report_count):
+        """Queue an alert for the next batched send and wait for its result"""
+        if aiohttp is None:
+            return await asyncio.to_thread(self.send_high_priority_alert, phone_numbers, location_data, report_count)
+        
+        # Bind first so alerts stranded on a previous loop release their slots before the rate check
+        self._bind_loop()
+        
+        error, location_key, message, clean_numbers = self._prepare_alert(phone_numbers, location_data, report_count)
+        if error:
+            return False, error
+        
+        return await self._enqueue_alert(location_key, message, clean_numbers)
+    
+    def _bind_loop(self):
+        """Attach the queue and flush task to the running loop, discarding state from a dead one"""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        
+        if self._pending is not None:
+            self._fail_pending("SMS alert was not sent: event loop stopped")
+        
+        self._loop = loop
+        self._pending = asyncio.Queue()
+        self._flush_task = None
+    
+    def _enqueue_alert(self, location_key, message, clean_numbers):
+        """Reserve the location's rate limit slot and queue the alert; returns a future for its result"""
+        # Reserve now so later alerts for this location are rate limited before the batch is sent
+        previous = self.sent_alerts.get(location_key)
+        self._mark_alert_sent(location_key)
+        
+        future = self._loop.create_future()
+        self._pending.put_nowait((message, location_key, previous, clean_numbers, future))
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self._flush_loop())
+        return future
+    
+    def _release_alert(self, location_key, previous):
+        """Undo a rate limit reservation after a failed send"""
+        if previous is None:
+            self.sent_alerts.pop(location_key, None)
+        else:
+            self.sent_alerts[location_key] = previous
+    
+    def _settle(self, entry, outcome):
+        """Resolve a queued alert's future, releasing its rate limit slot if it failed"""
+        _, location_key, previous, _, future = entry
+        if not outcome[0]:
+            self._release_alert(location_key, previous)
+        
+        if not future.done():
+            try:
+                future.set_result(outcome)
+            except RuntimeError:  # Future belongs to a loop that has already closed
+                pass
+    
+    def _fail_pending(self, reason):
+        """Fail every alert still waiting in the queue"""
+        while not self._pending.empty():
+            self._settle(self._pending.get_nowait(), (False, reason))
+    
+    async def _flush_loop(self):
+        """Drain queued alerts every FLUSH_INTERVAL seconds, exiting once the queue is idle"""
+        try:
+            while True:
+                # The session lives only as long as this flush task, so it never outlives its loop
+                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as http:
+                    while True:
+                        await asyncio.sleep(self.FLUSH_INTERVAL)
+                        
+                        batch = []
+                        while not self._pending.empty():
+                            batch.append(self._pending.get_nowait())
+                        
+                        if not batch:
+                            break
+                        await self._send_batch(http, batch)
+                
+                # No await between this check and returning, so a new alert either is
+                # seen here or finds the task done and starts a new one
+                if self._pending.empty():
+                    return
+        finally:
+            self._fail_pending("SMS alert was not sent: alert queue stopped")
+    
+    async def _send_batch(self, http, batch):
+        """Group queued alerts by message text and send one request per group concurrently"""
+        groups = {}
+        for entry in batch:
+            groups.setdefault(entry[0], []).append(entry)
+        
+        try:
+            await asyncio.gather(*(self._send_group(http, message, entries) for message, entries in groups.items()))
+        finally:
+            # Settles anything left unresolved if sending was cancelled or raised
+            for entry in batch:
+                self._settle(entry, (False, "SMS alert was not sent: alert queue stopped"))
+    
+    async def _send_group(self, http, message, entries):
+        # Deduplicate numbers across coalesced alerts, keeping their order
+        numbers = list(dict.fromkeys(number for entry in entries for number in entry[3]))
+        
+        try:
+            async with http.post(self.base_url, data=self._build_payload(message, numbers)) as response:
+                if response.status == 200:
+                    result = await response.json(content_type=None)
+                    if result.get('return') == True:
+                        logger.info(f"SMS alert sent successfully to {len(numbers)} numbers")
+                        outcome = (True, f"Alert sent to {len(numbers)} recipients")
+                    else:
+                        error_msg = result.get('message', 'Unknown error')
+                        logger.error(f"Fast2SMS API error: {error_msg}")
+                        outcome = (False, f"SMS API error: {error_msg}")
+                else:
+                    logger.error(f"Fast2SMS HTTP error: {response.status}")
+                    outcome = (False, f"SMS service error: {response.status}")
+        except asyncio.TimeoutError:
+            logger.error("SMS request timeout")
+            outcome = (False, "SMS request timeout")
+        except aiohttp.ClientError as e:
+            logger.error(f"SMS request error: {e}")
+            outcome = (False, f"SMS request failed: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected SMS error: {e}")
+            outcome = (False, f"Unexpected error: {str(e)}")
+        
+        for entry in entries:
+            self._settle(entry, outcome)
+    
+    async def close(self):
+        """Stop the flush task, failing and releasing any alerts that haven't been sent"""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        
+        # A task cancelled before its first step never runs its cleanup
+        if self._pending is not None:
+            self._fail_pending("SMS alert was not sent: service closed")
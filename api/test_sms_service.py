@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test script to verify SMS batching and rate limiting against a local stub Fast2SMS endpoint
+"""
+
+import asyncio
+from aiohttp import web
+
+from sms_service import SMSService, AsyncSMSService
+
+TEST_LOCATION = {'lat': 12.9716, 'lng': 77.5946, 'address': 'MG Road'}
+
+class StubFast2SMS:
+    """Local endpoint that records POSTs and answers like Fast2SMS"""
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.posts = []
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        self.posts.append(dict(await request.post()))
+        return web.json_response({'return': self.succeed, 'message': 'stub failure'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+def make_service(stub):
+    service = AsyncSMSService()
+    service.api_key = 'test-key'
+    service.base_url = stub.url
+    return service
+
+def test_clean_number():
+    """Phone numbers are normalized to 10 digits"""
+    print("Testing phone number cleaning...")
+    service = SMSService()
+    assert service._clean_number('+91 98765-43210') == '9876543210'
+    assert service._clean_number('919876543210') == '9876543210'
+    assert service._clean_number(9876543210) == '9876543210'
+    print("✅ Phone number cleaning passed")
+
+def test_rate_limit_lru():
+    """Rate limit bookkeeping is capped and blocks repeat alerts"""
+    print("Testing rate limit LRU...")
+    service = SMSService()
+    service.max_tracked_locations = 2
+    for key in ('a', 'b', 'c'):
+        service._mark_alert_sent(key)
+    assert list(service.sent_alerts) == ['b', 'c']
+    assert service._can_send_alert('a')
+    assert not service._can_send_alert('c')
+    print("✅ Rate limit LRU passed")
+
+def test_identical_messages_coalesce():
+    """Two alerts with the same message text go out as one POST"""
+    print("Testing alert coalescing...")
+
+    async def run():
+        stub = StubFast2SMS()
+        await stub.start()
+        service = make_service(stub)
+        # Different locations, same message text (same address and report count)
+        other_location = dict(TEST_LOCATION, lat=13.0827, lng=80.2707)
+        results = await asyncio.gather(
+            service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 5),
+            service.queue_high_priority_alert(['9876543211'], other_location, 5)
+        )
+        await service.close()
+        await stub.stop()
+        return stub, results
+
+    stub, results = asyncio.run(run())
+    assert all(success for success, _ in results), results
+    assert len(stub.posts) == 1, stub.posts
+    assert stub.posts[0]['numbers'] == '9876543210,9876543211'
+    print("✅ Alert coalescing passed")
+
+def test_same_location_rate_limited_while_queued():
+    """A second alert for a queued location is rate limited before the batch is sent"""
+    print("Testing rate limit reservation...")
+
+    async def run():
+        stub = StubFast2SMS()
+        await stub.start()
+        service = make_service(stub)
+        results = await asyncio.gather(
+            service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 5),
+            service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 6)
+        )
+        await service.close()
+        await stub.stop()
+        return stub, results
+
+    stub, results = asyncio.run(run())
+    assert results[0][0] and not results[1][0], results
+    assert len(stub.posts) == 1
+    print("✅ Rate limit reservation passed")
+
+def test_failed_send_releases_slot():
+    """A failed send releases the location's rate limit slot"""
+    print("Testing slot release on failure...")
+
+    async def run():
+        stub = StubFast2SMS(succeed=False)
+        await stub.start()
+        service = make_service(stub)
+        first = await service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 5)
+        stub.succeed = True
+        second = await service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 5)
+        await service.close()
+        await stub.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert not first[0], first
+    assert second[0], second
+    print("✅ Slot release on failure passed")
+
+def test_close_settles_pending_alerts():
+    """close() fails queued alerts instead of leaving callers waiting"""
+    print("Testing close with pending alerts...")
+
+    async def run():
+        stub = StubFast2SMS()
+        await stub.start()
+        service = make_service(stub)
+        task = asyncio.ensure_future(service.queue_high_priority_alert(['9876543210'], TEST_LOCATION, 5))
+        await asyncio.sleep(0)
+        await service.close()
+        result = await asyncio.wait_for(task, timeout=1)
+        await stub.stop()
+        return service, stub, result
+
+    service, stub, result = asyncio.run(run())
+    assert not result[0], result
+    assert not stub.posts
+    assert service._can_send_alert(service._get_location_key(TEST_LOCATION['lat'], TEST_LOCATION['lng']))
+    print("✅ Close with pending alerts passed")
+
+def test_new_event_loop_per_call():
+    """Each asyncio.run() call gets a working queue and session"""
+    print("Testing one event loop per call...")
+    stub_holder = {}
+
+    async def send(lat):
+        if 'stub' not in stub_holder:
+            stub_holder['stub'] = StubFast2SMS()
+        stub = stub_holder['stub']
+        await stub.start()
+        stub_holder.setdefault('service', make_service(stub)).base_url = stub.url
+        result = await stub_holder['service'].queue_high_priority_alert(['9876543210'], dict(TEST_LOCATION, lat=lat), 5)
+        await stub.stop()
+        return result
+
+    first = asyncio.run(send(12.0))
+    second = asyncio.run(send(13.0))
+    assert first[0] and second[0], (first, second)
+    print("✅ One event loop per call passed")
+
+def main():
+    """Main test function"""
+    print("📱 SMS Service Testing")
+    print("=" * 50)
+
+    test_clean_number()
+    test_rate_limit_lru()
+    test_identical_messages_coalesce()
+    test_same_location_rate_limited_while_queued()
+    test_failed_send_releases_slot()
+    test_close_settles_pending_alerts()
+    test_new_event_loop_per_call()
+
+    print("\n" + "=" * 50)
+    print("🎉 Testing complete!")
+
+if __name__ == "__main__":
+    main()